@@ -18,42 +18,72 @@ from builtins import *
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
 
+from collections import namedtuple, OrderedDict
+from functools import partial
+import hashlib
 import logging
 import sys
+import threading
 
 import numpy as np
 
 import eta.constants as etac
-from eta.core.config import Config
+from eta.core.config import Config, ConfigError
 import eta.core.data as etad
 from eta.core.features import ImageFeaturizer
+import eta.core.image as etai
 import eta.core.learning as etal
 import eta.core.tfutils as etat
 import eta.core.utils as etau
 
-sys.path.insert(1, etac.TF_SLIM_DIR)
+
+def _setup():
+    if etac.TF_SLIM_DIR not in sys.path:
+        sys.path.insert(1, etac.TF_SLIM_DIR)
+
 
 _ensure_tf1 = lambda: etau.ensure_import("tensorflow<2")
 tf = etau.lazy_import("tensorflow", callback=_ensure_tf1)
 
 _ERROR_MSG = "You must run `eta install models` in order to use this model"
 pf = etau.lazy_import(
-    "preprocessing.preprocessing_factory", error_msg=_ERROR_MSG
+    "preprocessing.preprocessing_factory",
+    callback=_setup,
+    error_msg=_ERROR_MSG,
+)
+nf = etau.lazy_import(
+    "nets.nets_factory", callback=_setup, error_msg=_ERROR_MSG
 )
-nf = etau.lazy_import("nets.nets_factory", error_msg=_ERROR_MSG)
 
 
 logger = logging.getLogger(__name__)
 
 
-# Networks for which we provide preprocessing implemented in numpy
+# Networks for which we provide preprocessing implemented in numpy. Each value
+# is a `(resize_fcn, normalize_fcn)` tuple, where `resize_fcn` is applied in
+# numpy and returns uint8 images, and `normalize_fcn` is applied in-graph
 _NUMPY_PREPROC_FUNCTIONS = {
-    "resnet_v1_50": etat.vgg_preprocessing_numpy,
-    "resnet_v2_50": etat.inception_preprocessing_numpy,
-    "mobilenet_v2": etat.inception_preprocessing_numpy,
-    "inception_v3": etat.inception_preprocessing_numpy,
-    "inception_v4": etat.inception_preprocessing_numpy,
-    "inception_resnet_v2": etat.inception_preprocessing_numpy,
+    "resnet_v1_50": (etat.vgg_resize_numpy, etat.vgg_normalization_tf),
+    "resnet_v2_50": (
+        etat.inception_resize_numpy,
+        etat.inception_normalization_tf,
+    ),
+    "mobilenet_v2": (
+        etat.inception_resize_numpy,
+        etat.inception_normalization_tf,
+    ),
+    "inception_v3": (
+        etat.inception_resize_numpy,
+        etat.inception_normalization_tf,
+    ),
+    "inception_v4": (
+        etat.inception_resize_numpy,
+        etat.inception_normalization_tf,
+    ),
+    "inception_resnet_v2": (
+        etat.inception_resize_numpy,
+        etat.inception_normalization_tf,
+    ),
 }
 
 # Networks for which we provide default `features_name`s
@@ -76,6 +106,50 @@ _DEFAULT_OUTPUT_NAMES = {
     "inception_resnet_v2": "InceptionResnetV2/Logits/Predictions",
 }
 
+# The number of images per batch to use when calibrating INT8 models
+_CALIBRATION_BATCH_SIZE = 32
+
+# The prefix under which models are imported into their graphs
+_PREFIX = "main"
+
+# Per-network defaults from the above maps, resolved once at import time. The
+# `*_op_name` fields are the names of the operations in the imported graph
+_NetSpec = namedtuple(
+    "_NetSpec",
+    [
+        "features_name",
+        "features_op_name",
+        "output_name",
+        "output_op_name",
+        "numpy_preproc_fcns",
+    ],
+)
+
+
+def _make_op_name(name):
+    return _PREFIX + "/" + name if name is not None else None
+
+
+def _make_net_spec(network_name):
+    features_name = _DEFAULT_FEATURES_NAMES.get(network_name, None)
+    output_name = _DEFAULT_OUTPUT_NAMES.get(network_name, None)
+    return _NetSpec(
+        features_name=features_name,
+        features_op_name=_make_op_name(features_name),
+        output_name=output_name,
+        output_op_name=_make_op_name(output_name),
+        numpy_preproc_fcns=_NUMPY_PREPROC_FUNCTIONS.get(network_name, None),
+    )
+
+
+_NET_SPECS = {
+    network_name: _make_net_spec(network_name)
+    for network_name in set(_NUMPY_PREPROC_FUNCTIONS)
+    | set(_DEFAULT_FEATURES_NAMES)
+    | set(_DEFAULT_OUTPUT_NAMES)
+}
+_EMPTY_NET_SPEC = _make_net_spec(None)
+
 
 class TFSlimClassifierConfig(Config, etal.HasPublishedModel):
     """Configuration class for loading a TensorFlow classifier whose network
@@ -107,6 +181,30 @@ class TFSlimClassifierConfig(Config, etal.HasPublishedModel):
         confidence_thresh: a confidence threshold to apply to candidate
             predictions
         generate_features: whether to generate features for predictions
+        use_tensorrt: whether to optimize the graph for GPU inference via
+            TF-TRT at load time. Ignored if no GPU is available
+        trt_precision: the TensorRT precision mode to use when `use_tensorrt`
+            is True. Supported values are "FP32", "FP16", and "INT8". The
+            default is "FP16"
+        calibration_images_dir: a directory of representative images to use
+            to calibrate the model when `trt_precision` is "INT8"
+        intra_op_threads: the number of threads that TF may use to parallelize
+            the execution of individual ops such as convolutions and matrix
+            multiplications (Eigen's thread pool). By default, TF chooses the
+            number of threads based on the CPUs available to the process
+        inter_op_threads: the number of threads that TF may use to execute
+            independent ops concurrently, such as the parallel branches of
+            the Inception networks. By default, TF chooses the number of
+            threads based on the CPUs available to the process
+        use_xla: whether to enable XLA JIT compilation of the graph. The
+            default is False
+        warm_up: whether to run dummy images through the classifier when its
+            context is entered. The default is True
+        warm_up_batch_sizes: the batch sizes at which to warm up the
+            classifier. When using TF-TRT, engines are built per batch size,
+            so these should match the batch sizes used for inference. The
+            default is `[1, 32]`, the batch sizes used by `predict()` and
+            `predict_batch()`
     """
 
     def __init__(self, d):
@@ -131,6 +229,37 @@ class TFSlimClassifierConfig(Config, etal.HasPublishedModel):
         self.generate_features = self.parse_bool(
             d, "generate_features", default=False
         )
+        self.use_tensorrt = self.parse_bool(d, "use_tensorrt", default=False)
+        self.trt_precision = self.parse_categorical(
+            d, "trt_precision", ["FP32", "FP16", "INT8"], default="FP16"
+        )
+        self.calibration_images_dir = self.parse_string(
+            d, "calibration_images_dir", default=None
+        )
+        self.intra_op_threads = self.parse_number(
+            d, "intra_op_threads", default=None
+        )
+        self.inter_op_threads = self.parse_number(
+            d, "inter_op_threads", default=None
+        )
+        self.use_xla = self.parse_bool(d, "use_xla", default=False)
+        self.warm_up = self.parse_bool(d, "warm_up", default=True)
+        self.warm_up_batch_sizes = self.parse_array(
+            d, "warm_up_batch_sizes", default=[1, 32]
+        )
+
+        self._validate()
+
+    def _validate(self):
+        if (
+            self.use_tensorrt
+            and self.trt_precision == "INT8"
+            and not self.calibration_images_dir
+        ):
+            raise ConfigError(
+                "`calibration_images_dir` is required when `trt_precision` "
+                "is 'INT8'"
+            )
 
 
 class TFSlimClassifier(
@@ -159,14 +288,10 @@ class TFSlimClassifier(
         self.config.download_model_if_necessary()
         model_path = self.config.model_path
 
-        # Load model
-        self._prefix = "main"
-        self._graph = etat.load_graph(model_path, prefix=self._prefix)
-        self._sess = None
-
         # Load class labels
         labels_map = etal.load_labels_map(self.config.labels_path)
         self._class_labels = etal.get_class_labels(labels_map)
+        self._class_labels_arr = np.asarray(self._class_labels, dtype=object)
         self._num_classes = len(self._class_labels)
 
         # Get network
@@ -175,56 +300,134 @@ class TFSlimClassifier(
             network_name, num_classes=self._num_classes, is_training=False
         )
         self.img_size = network_fn.default_image_size
+        spec = _NET_SPECS.get(network_name, _EMPTY_NET_SPEC)
 
-        # Get input operation
-        self._input_op = self._graph.get_operation_by_name(
-            self._prefix + "/" + self.config.input_name
-        )
-
-        # Get feature operation, if necessary
+        # Get features name, if necessary
         features_name = None
+        features_op_name = None
         if self.config.generate_features:
             if self.config.features_name:
                 features_name = self.config.features_name
-            elif network_name in _DEFAULT_FEATURES_NAMES:
-                features_name = _DEFAULT_FEATURES_NAMES[network_name]
-        if features_name is not None:
-            self._features_op = self._graph.get_operation_by_name(
-                self._prefix + "/" + features_name
-            )
-        else:
-            self._features_op = None
+                features_op_name = _make_op_name(features_name)
+            else:
+                features_name = spec.features_name
+                features_op_name = spec.features_op_name
 
-        # Get output operation
+        # Get output name
         if self.config.output_name:
             output_name = self.config.output_name
+            output_op_name = _make_op_name(output_name)
         else:
-            output_name = _DEFAULT_OUTPUT_NAMES.get(network_name, None)
+            output_name = spec.output_name
+            output_op_name = spec.output_op_name
             if output_name is None:
                 raise ValueError(
                     "`output_name` was not provided and network `%s` was not "
                     "found in default outputs map" % network_name
                 )
-        self._output_op = self._graph.get_operation_by_name(
-            self._prefix + "/" + output_name
-        )
 
         # Setup preprocessing
+        self._prefix = _PREFIX
+        self._graph = tf.Graph()
+        self._sess = None
+        self._pp_sess = None
+        self._pp_img = None
+        self._pp_img_out = None
+        self._pp_imgs = None
+        self._pp_imgs_out = None
+        self._pp_input = None
+        self._pp_ragged_imgs = None
+        self._pp_ragged_lock = threading.Lock()
+        self._pp_ragged_batch_size = None
+        self._pp_ragged_init = None
+        self._pp_ragged_out = None
+        self._resize_fcn = None
         self._transforms = self._make_preprocessing_fcn(
-            network_name, self.config.preprocessing_fcn
+            network_name, spec, self.config.preprocessing_fcn
         )
         self._preprocess = True
 
+        # Load model
+        graph_def = etat.load_graph_def(model_path)
+        if self.config.use_tensorrt:
+            graph_def = self._optimize_with_tensorrt(
+                graph_def, [n for n in (features_name, output_name) if n]
+            )
+
+        # Graft any in-graph preprocessing in front of the model's input
+        if self._pp_imgs_out is not None:
+            input_map = {self.config.input_name + ":0": self._pp_imgs_out}
+        else:
+            input_map = None
+
+        etat.import_graph_def(
+            graph_def,
+            graph=self._graph,
+            prefix=self._prefix,
+            input_map=input_map,
+        )
+
+        # Get input operation
+        if self._pp_input is not None:
+            # The model's own input is now bypassed, so the outputs of
+            # `transforms` are fed to the in-graph preprocessing instead
+            self._input_op = self._pp_input.op
+        else:
+            self._input_op = self._graph.get_operation_by_name(
+                _make_op_name(self.config.input_name)
+            )
+
+        # Get feature operation, if necessary
+        if features_op_name is not None:
+            self._features_op = self._graph.get_operation_by_name(
+                features_op_name
+            )
+        else:
+            self._features_op = None
+
+        # Get output operation
+        self._output_op = self._graph.get_operation_by_name(output_op_name)
+
+        # Get fused features + output operation, if possible
+        self._features_shape = None
+        self._fused_op = self._make_fused_op()
+
+        # Cache the tensors that are fed and fetched during inference
+        self._input_tensor = self._input_op.outputs[0]
+        self._output_tensor = self._output_op.outputs[0]
+        if self._features_op is not None:
+            self._features_tensor = self._features_op.outputs[0]
+        else:
+            self._features_tensor = None
+
+        if self._fused_op is not None:
+            self._fused_tensor = self._fused_op.outputs[0]
+        else:
+            self._fused_tensor = None
+
+        self._callables = {}
         self._last_features = None
         self._last_probs = None
 
     def __enter__(self):
-        self._sess = self.make_tf_session(graph=self._graph)
+        self._sess = self.make_tf_session(
+            config_proto=self._make_config_proto(), graph=self._graph
+        )
+        self._callables = {}
+        if self.config.warm_up:
+            self.warm_up()
+
         return self
 
     def __exit__(self, *args):
         self.close()
 
+    def close(self):
+        """Closes any TensorFlow session(s) in use by this instance."""
+        etat.UsesTFSession.close(self)
+        self._sess = None
+        self._pp_sess = None
+
     @property
     def is_multilabel(self):
         """Whether the classifier generates single labels (False) or multiple
@@ -244,6 +447,9 @@ class TFSlimClassifier(
     def transforms(self):
         """The preprocessing transformation that will be applied to each image
         before prediction, or `None` if no preprocessing is performed.
+
+        When used outside of the classifier's context, TF-Slim preprocessing
+        runs in a separate session, which is closed by :meth:`close`.
         """
         return self._transforms
 
@@ -271,7 +477,7 @@ class TFSlimClassifier(
         if not self.exposes_features:
             return None
 
-        dim = self._features_op.outputs[0].get_shape().as_list()[-1]
+        dim = self._features_tensor.get_shape().as_list()[-1]
         if dim is None:
             logger.warning(
                 "Unable to statically get feature dimension; returning None"
@@ -294,6 +500,28 @@ class TFSlimClassifier(
         """The list of class labels generated by the classifier."""
         return self._class_labels
 
+    def warm_up(self, batch_sizes=None):
+        """Runs batches of dummy images through the classifier so that
+        one-time costs such as kernel selection, JIT compilation, and TF-TRT
+        engine building are not incurred by the first real predictions.
+
+        This method is automatically called when the classifier's context is
+        entered, unless `warm_up` is False in its config. The outputs of the
+        last prediction are not affected.
+
+        Args:
+            batch_sizes: an optional list of batch sizes at which to warm up
+                the classifier. By default, the `warm_up_batch_sizes` from the
+                classifier's config are used
+        """
+        if batch_sizes is None:
+            batch_sizes = self.config.warm_up_batch_sizes
+
+        dim = self.img_size
+        for batch_size in batch_sizes:
+            imgs = np.zeros((int(batch_size), dim, dim, 3), dtype=np.uint8)
+            self._infer(imgs)
+
     def get_features(self):
         """Gets the features generated by the classifier from its last
         prediction.
@@ -323,6 +551,11 @@ class TFSlimClassifier(
     def predict(self, img):
         """Peforms prediction on the given image.
 
+        Note that running inference on one image at a time is much less
+        efficient per image than running on batches of images. Use
+        :meth:`predict_batch` or :meth:`predict_all` when you have multiple
+        images to process.
+
         Args:
             img: an image
 
@@ -344,35 +577,113 @@ class TFSlimClassifier(
         """
         return self._predict(imgs)
 
+    def predict_batch(self, imgs, batch_size=32):
+        """Performs prediction on the given images in batches of the given
+        size.
+
+        This method is useful when you have more images than can be processed
+        in a single call to :meth:`predict_all`. The features and
+        probabilities for all images are available afterwards via
+        :meth:`get_features` and :meth:`get_probabilities`.
+
+        Args:
+            imgs: a list (or n x h x w x 3 tensor) of images
+            batch_size: the number of images to process per inference call.
+                The default is 32
+
+        Returns:
+            a list of `eta.core.data.AttributeContainer` instances describing
+                the predictions for each image
+        """
+        predictions = []
+        all_features = []
+        all_probs = []
+        max_num_preds = 0
+        for start in range(0, len(imgs), batch_size):
+            preds, features, probs, num_preds = self._infer(
+                imgs[start : (start + batch_size)]
+            )
+            predictions.extend(preds)
+            all_features.append(features)
+            all_probs.append(probs)
+            max_num_preds = max(max_num_preds, num_preds)
+
+        if predictions:
+            if self.exposes_features:
+                features = np.concatenate(all_features)
+            else:
+                features = None
+
+            probs = np.concatenate(all_probs)
+            self._record_outputs(features, probs, max_num_preds)
+
+        return predictions
+
     def _predict(self, imgs):
+        predictions, features, probs, max_num_preds = self._infer(imgs)
+        self._record_outputs(features, probs, max_num_preds)
+        return predictions
+
+    def _infer(self, imgs):
         # Perform preprocessing
-        if self.preprocess:
-            imgs = self._preprocess_batch(imgs)
+        if (
+            self.preprocess
+            and self._pp_imgs is not None
+            and _is_uniform_batch(imgs)
+        ):
+            # Preprocessing is fused into the inference graph
+            imgs = _to_uint8_batch(imgs)
+            in_tensor = self._pp_imgs
+        else:
+            if self.preprocess:
+                imgs = self._preprocess_batch(imgs)
+
+            in_tensor = self._input_tensor
 
         # Perform inference
-        if self.exposes_features:
+        if self._fused_tensor is not None:
+            # Features and probabilities are fetched in a single transfer
+            fused = self._evaluate(imgs, in_tensor, [self._fused_tensor])[0]
+            size = fused.shape[1] - self.num_classes
+            features = fused[:, :size].reshape((-1,) + self._features_shape)
+            probs = fused[:, size:]
+        elif self.exposes_features:
             features, probs = self._evaluate(
-                imgs, [self._features_op, self._output_op]
+                imgs, in_tensor, [self._features_tensor, self._output_tensor]
             )
         else:
             features = None
-            probs = self._evaluate(imgs, [self._output_op])[0]
+            probs = self._evaluate(imgs, in_tensor, [self._output_tensor])[0]
 
         # Parse predictions
-        max_num_preds = 0
+        attr_name = self.config.attr_name
+        inds = np.argmax(probs, axis=1)
+        labels = self._class_labels_arr[inds]
+        confidences = probs[np.arange(len(inds)), inds]
+        keeps = confidences > self.config.confidence_thresh
         predictions = []
-        for probsi in probs:
-            # Filters predictions, if necessary
-            predsi, keepi = self._parse_prediction(probsi)
-            if keepi:
-                max_num_preds = 1
+        for label, confidence, keep in zip(labels, confidences, keeps):
+            attrs = etad.AttributeContainer()
+            if keep:
+                attrs.add(
+                    etad.CategoricalAttribute(
+                        attr_name, label, confidence=confidence
+                    )
+                )
+
+            predictions.append(attrs)
 
-            # Record predictions
-            predictions.append(predsi)
+        max_num_preds = 1 if keeps.any() else 0
 
+        return predictions, features, probs, max_num_preds
+
+    def _record_outputs(self, features, probs, max_num_preds):
         # Trim unnecessary dimensions
-        probs = probs[:, np.newaxis, :]
-        probs = probs[:, :max_num_preds, :]
+        if max_num_preds:
+            probs = np.expand_dims(probs, 1)
+        else:
+            shape = (len(probs), 0, probs.shape[1])
+            probs = np.empty(shape, dtype=probs.dtype)
 
         # Save data, if necessary
         if self.exposes_features:
@@ -380,33 +691,169 @@ class TFSlimClassifier(
 
         self._last_probs = probs  # n x 1 x num_classes
 
-        return predictions
-
     def _preprocess_batch(self, imgs):
-        return [self.transforms(img) for img in imgs]
-
-    def _evaluate(self, imgs, ops):
-        in_tensor = self._input_op.outputs[0]
-        out_tensors = [op.outputs[0] for op in ops]
-        return self._sess.run(out_tensors, feed_dict={in_tensor: imgs})
-
-    def _parse_prediction(self, probs):
-        idx = np.argmax(probs)
-        label = self.class_labels[idx]
-        confidence = probs[idx]
-
-        attrs = etad.AttributeContainer()
-        keep = confidence > self.config.confidence_thresh
-        if keep:
-            attrs.add(
-                etad.CategoricalAttribute(
-                    self.config.attr_name, label, confidence=confidence
-                )
+        if self._pp_ragged_out is not None:
+            # Preprocess all images in parallel via `tf.data`. The pipeline
+            # reads its input from `self._pp_ragged_imgs`, so only one batch
+            # can be processed at a time
+            with self._pp_ragged_lock:
+                self._pp_ragged_imgs = _to_uint8_batch(imgs)
+                try:
+                    self._sess.run(
+                        self._pp_ragged_init,
+                        feed_dict={self._pp_ragged_batch_size: len(imgs)},
+                    )
+                    return self._sess.run(self._pp_ragged_out)
+                finally:
+                    self._pp_ragged_imgs = None
+
+        if self._resize_fcn is None:
+            return [self.transforms(img) for img in imgs]
+
+        # Resize directly into a preallocated, C-contiguous batch so that no
+        # additional copy is required to build the input tensor
+        dim = self.img_size
+        resize_fcn = self._resize_fcn
+        batch = np.empty((len(imgs), dim, dim, 3), dtype=np.uint8)
+        for idx, img in enumerate(imgs):
+            resize_fcn(img, out=batch[idx])
+
+        return batch
+
+    def _evaluate(self, imgs, in_tensor, out_tensors):
+        # Callables bypass the feed/fetch parsing that `sess.run()` performs
+        # on every call
+        key = (in_tensor, tuple(out_tensors))
+        try:
+            fcn, dtype = self._callables[key]
+        except KeyError:
+            fcn = self._sess.make_callable(out_tensors, feed_list=[in_tensor])
+            dtype = in_tensor.dtype.as_numpy_dtype
+            self._callables[key] = (fcn, dtype)
+
+        return fcn(np.asarray(imgs, dtype=dtype))
+
+    def _make_fused_op(self):
+        if self._features_op is None:
+            return None
+
+        features = self._features_op.outputs[0]
+        output = self._output_op.outputs[0]
+
+        # Fusing requires the features to have a static shape so that they
+        # can be unflattened on the host
+        features_shape = features.get_shape()[1:]
+        if (
+            not features_shape.is_fully_defined()
+            or output.get_shape().ndims != 2
+            or output.get_shape().as_list()[1] != self.num_classes
+            or features.dtype != output.dtype
+        ):
+            return None
+
+        self._features_shape = tuple(features_shape.as_list())
+        size = int(np.prod(self._features_shape))
+
+        # pylint: disable=not-context-manager
+        with self._graph.as_default():
+            fused = tf.concat(
+                [tf.reshape(features, [-1, size]), output],
+                axis=1,
+                name="fused_outputs",
+            )
+
+        return fused.op
+
+    def _make_config_proto(self):
+        config_proto = tf.ConfigProto()
+
+        if self.config.intra_op_threads is not None:
+            config_proto.intra_op_parallelism_threads = int(
+                self.config.intra_op_threads
+            )
+
+        if self.config.inter_op_threads is not None:
+            config_proto.inter_op_parallelism_threads = int(
+                self.config.inter_op_threads
+            )
+
+        if self.config.use_xla:
+            optimizer_options = config_proto.graph_options.optimizer_options
+            optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+
+        return config_proto
+
+    def _optimize_with_tensorrt(self, graph_def, output_names):
+        if not etat.is_gpu_available():
+            logger.warning(
+                "TensorRT optimization requires a GPU, but none was found; "
+                "using the unoptimized graph"
+            )
+            return graph_def
+
+        precision_mode = self.config.trt_precision
+        logger.info(
+            "Optimizing graph with TensorRT (precision %s)", precision_mode
+        )
+
+        if precision_mode != "INT8":
+            return etat.optimize_graph_def_with_tensorrt(
+                graph_def, output_names, precision_mode=precision_mode
+            )
+
+        # INT8 quantization ranges are calibrated on representative images
+        images_dir = self.config.calibration_images_dir
+        paths = etau.list_files(images_dir, abs_paths=True)
+        if not paths:
+            raise ValueError(
+                "No calibration images found in '%s'" % images_dir
+            )
+
+        batch_size = _CALIBRATION_BATCH_SIZE
+        starts = range(0, len(paths), batch_size)
+        num_batches = len(starts)
+        batches = (paths[i : (i + batch_size)] for i in starts)
+        input_name = self.config.input_name + ":0"
+
+        # The preprocessing ops have already been built in `self._graph`
+        sess = etat.make_tf_session(graph=self._graph)
+        try:
+            feed_fcn = lambda: {
+                input_name: self._load_calibration_batch(sess, next(batches))
+            }
+            return etat.optimize_graph_def_with_tensorrt(
+                graph_def,
+                output_names,
+                precision_mode=precision_mode,
+                calibration_feed_fcn=feed_fcn,
+                num_calibration_runs=num_batches,
             )
+        finally:
+            sess.close()
 
-        return attrs, keep
+    def _load_calibration_batch(self, sess, paths):
+        imgs = [etai.read(path) for path in paths]
+
+        # User-provided preprocessing
+        if self._pp_imgs_out is None:
+            return np.asarray(self._preprocess_batch(imgs), dtype=np.float32)
+
+        # Numpy resizing + in-graph normalization
+        if self._resize_fcn is not None:
+            return sess.run(
+                self._pp_imgs_out,
+                feed_dict={self._pp_input: self._preprocess_batch(imgs)},
+            )
 
-    def _make_preprocessing_fcn(self, network_name, preprocessing_fcn):
+        # TF-slim preprocessing
+        return np.stack(
+            [
+                sess.run(self._pp_img_out, feed_dict={self._pp_img: img})
+                for img in imgs
+            ]
+        )
+
+    def _make_preprocessing_fcn(self, network_name, spec, preprocessing_fcn):
         dim = self.img_size
 
         # Use user-specified preprocessing, if provided
@@ -418,27 +865,123 @@ class TFSlimClassifier(
             return lambda img: user_fcn(img, dim, dim)
 
         # Use numpy-based preprocessing if supported
-        numpy_fcn = _NUMPY_PREPROC_FUNCTIONS.get(network_name, None)
-        if numpy_fcn is not None:
+        numpy_fcns = spec.numpy_preproc_fcns
+        if numpy_fcns is not None:
             logger.debug(
                 "Using numpy-based preprocessing for network '%s'",
                 network_name,
             )
-            return lambda img: numpy_fcn(img, dim, dim)
+            resize_fcn, normalize_fcn = numpy_fcns
+
+            # Specialize the resizing for this network's fixed input size
+            self._resize_fcn = partial(resize_fcn, height=dim, width=dim)
+
+            # Images are resized in numpy but fed to the graph as uint8, so
+            # the float conversion and normalization happen on-device
+            # pylint: disable=not-context-manager
+            with self._graph.as_default():
+                self._pp_input = tf.placeholder(
+                    tf.uint8, [None, dim, dim, 3], name="resized"
+                )
+                self._pp_imgs_out = tf.identity(
+                    normalize_fcn(self._pp_input), name="preprocessed"
+                )
+
+            return self._resize_fcn
 
         # TF-slim preprocessing
         logger.debug(
             "Using TF-based preprocessing for network '%s'", network_name
         )
         tfslim_fcn = pf.get_preprocessing(network_name, is_training=False)
-        sess = self.make_tf_session()
-        _img = tf.placeholder("uint8", [None, None, 3])
-        _img_out = tfslim_fcn(_img, dim, dim)
-        return lambda img: sess.run(_img_out, feed_dict={_img: img})
+
+        # Build the preprocessing subgraph once, in the same graph as the
+        # model, so that it can be fused in front of the model's input
+        with self._graph.as_default():  # pylint: disable=not-context-manager
+            self._pp_img = tf.placeholder(tf.uint8, [None, None, 3])
+            self._pp_img_out = tfslim_fcn(self._pp_img, dim, dim)
+
+            # Batched variant for batches of images with the same shape
+            self._pp_imgs = tf.placeholder(tf.uint8, [None, None, None, 3])
+            self._pp_imgs_out = tf.identity(
+                tf.map_fn(
+                    lambda img: tfslim_fcn(img, dim, dim),
+                    self._pp_imgs,
+                    dtype=tf.float32,
+                ),
+                name="preprocessed",
+            )
+
+            # Parallel pipeline for batches of images with different shapes,
+            # which cannot be stacked and fed to `self._pp_imgs`
+            dataset = tf.data.Dataset.from_generator(
+                lambda: iter(self._pp_ragged_imgs),
+                tf.uint8,
+                output_shapes=tf.TensorShape([None, None, 3]),
+            )
+            dataset = dataset.map(
+                lambda img: tfslim_fcn(img, dim, dim),
+                num_parallel_calls=tf.data.experimental.AUTOTUNE,
+            )
+            self._pp_ragged_batch_size = tf.placeholder(tf.int64, [])
+            dataset = dataset.batch(self._pp_ragged_batch_size)
+            iterator = dataset.make_initializable_iterator()
+            self._pp_ragged_init = iterator.initializer
+            self._pp_ragged_out = iterator.get_next()
+
+        self._pp_input = self._pp_imgs_out
+
+        return self._preprocess_image
+
+    def _preprocess_image(self, img):
+        sess = self._sess
+        if sess is None:
+            # The preprocessing subgraph has no variables, so it can be run
+            # without loading the model
+            if self._pp_sess is None:
+                self._pp_sess = self.make_tf_session(graph=self._graph)
+
+            sess = self._pp_sess
+
+        return sess.run(
+            self._pp_img_out, feed_dict={self._pp_img: etai.to_uint8(img)}
+        )
+
+
+def _to_uint8_batch(imgs):
+    # Images are fed to the graph as uint8, so other integer types must be
+    # rescaled rather than cast
+    if isinstance(imgs, np.ndarray):
+        return etai.to_uint8(imgs)
+
+    return [etai.to_uint8(img) for img in imgs]
+
+
+def _is_uniform_batch(imgs):
+    # Whether `imgs` can be stacked into an `n x h x w x 3` tensor
+    if isinstance(imgs, np.ndarray):
+        return imgs.ndim == 4 and imgs.shape[3] == 3
+
+    if not imgs:
+        return False
+
+    shape = imgs[0].shape
+    if len(shape) != 3 or shape[2] != 3:
+        return False
+
+    return all(img.shape == shape for img in imgs)
 
 
 class TFSlimFeaturizerConfig(TFSlimClassifierConfig):
-    """Configuration settings for a TFSlimFeaturizer."""
+    """Configuration settings for a TFSlimFeaturizer.
+
+    See `TFSlimClassifierConfig` for the classifier attributes.
+
+    Attributes:
+        cache_size: the maximum number of feature vectors to cache, keyed by
+            the contents of the images that generated them, so that repeated
+            images are not re-featurized. The default is 0 (no caching)
+    """
 
     def __init__(self, d):
         # Featurizers don't care what attribute name the classifier uses
@@ -449,6 +992,8 @@ class TFSlimFeaturizerConfig(TFSlimClassifierConfig):
 
         super(TFSlimFeaturizerConfig, self).__init__(d)
 
+        self.cache_size = self.parse_number(d, "cache_size", default=0)
+
 
 class TFSlimFeaturizer(ImageFeaturizer):
     """Featurizer that embeds images into the feature space of a TF-Slim
@@ -465,6 +1010,7 @@ class TFSlimFeaturizer(ImageFeaturizer):
         self.config = config
         self.validate(self.config)
         self._classifier = None
+        self._cache = OrderedDict()
 
     def dim(self):
         """The dimension of the features extracted by this Featurizer."""
@@ -495,10 +1041,32 @@ class TFSlimFeaturizer(ImageFeaturizer):
         Returns:
             the feature vector (a 1D array)
         """
+        if not self.config.cache_size:
+            return self._compute_features(img)
+
+        key = _hash_image(img)
+        try:
+            features = self._cache.pop(key)
+        except KeyError:
+            features = self._compute_features(img)
+            if len(self._cache) >= self.config.cache_size:
+                self._cache.popitem(last=False)
+
+        # Most recently used features are stored last
+        self._cache[key] = features
+        return features.copy()
+
+    def _compute_features(self, img):
         self._classifier.predict(img)
         return self._classifier.get_features()
 
 
+def _hash_image(img):
+    img = np.ascontiguousarray(img)
+    digest = hashlib.md5(img.data).hexdigest()
+    return digest, img.shape, img.dtype.str
+
+
 def export_frozen_inference_graph(
     checkpoint_path,
     network_name,
@@ -1202,6 +1202,34 @@ def to_float(img):
     return img.astype(np.float32) / np.iinfo(img.dtype).max
 
 
+def to_uint8(img):
+    """Converts the given integer image to a uint8 image.
+
+    Images of other integer types are rescaled from the full range of their
+    type, like :func:`to_float`, rather than being cast.
+
+    Args:
+        img: an integer image
+
+    Returns:
+        the image in uint8 format. If the image is already uint8, it is
+            returned as-is
+
+    Raises:
+        ValueError: if the image does not have an integer type
+    """
+    if img.dtype == np.uint8:
+        return img
+
+    if not np.issubdtype(img.dtype, np.integer):
+        raise ValueError(
+            "Expected an integer image, but found type '%s'" % img.dtype
+        )
+
+    img = np.rint(to_float(img) * 255)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
 class Convert(object):
     """Interface for the ImageMagick convert binary."""
 
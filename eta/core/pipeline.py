@@ -190,7 +190,7 @@ def _run(
                 # Pipeline failed
                 logger.info("Pipeline %s failed", pipeline_config.name)
                 pipeline_status.fail()
-                pipeline_status.publish()
+                pipeline_status.publish(force=True)
                 return False
 
     if mark_as_complete:
@@ -198,7 +198,7 @@ def _run(
         logger.info("Pipeline %s complete", pipeline_config.name)
         pipeline_status.complete()
 
-    pipeline_status.publish()
+    pipeline_status.publish(force=True)
     return True
 
 
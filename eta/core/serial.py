@@ -19,7 +19,7 @@ from future.utils import iteritems, itervalues
 # pragma pylint: enable=wildcard-import
 
 from base64 import b64encode, b64decode
-from collections import OrderedDict
+from collections import deque, OrderedDict
 import copy
 import datetime as dt
 import dill as pickle
@@ -345,6 +345,10 @@ class Serializable(object):
         obj3 = Serializable.from_json(json_path)  # returns a SerializableClass
     """
 
+    # Allows subclasses to declare `__slots__`. Such subclasses must override
+    # `attributes()`, since the default implementation relies on `vars()`
+    __slots__ = ()
+
     def __str__(self):
         return self.to_str()
 
@@ -546,8 +550,8 @@ def _recurse(v, reflective):
     if isinstance(v, Serializable):
         return v.serialize(reflective=reflective)
 
-    if isinstance(v, set):
-        v = list(v)  # convert sets to lists
+    if isinstance(v, (set, deque)):
+        v = list(v)  # convert sets and deques to lists
 
     if isinstance(v, list):
         return [_recurse(vi, reflective) for vi in v]
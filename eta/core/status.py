@@ -17,16 +17,83 @@ from builtins import *
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
 
+from collections import deque, OrderedDict
 import datetime
+import itertools
 import logging
+import threading
+import time
 
-from eta.core.serial import Serializable
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from eta.core.serial import ETAJSONEncoder, Serializable
 import eta.core.utils as etau
 
 
 logger = logging.getLogger(__name__)
 
 
+# The default maximum number of messages retained by a PipelineStatus
+DEFAULT_MAX_MESSAGES = 1000
+
+
+# The `(monotonic time, UTC datetime)` pair from which message timestamps are
+# derived, and the number of seconds after which it is refreshed to bound any
+# drift relative to the system clock
+_TIME_BASE = None
+_TIME_BASE_REFRESH_SECS = 60
+
+
+def _utcnow():
+    global _TIME_BASE
+
+    now = time.monotonic()
+    if _TIME_BASE is None or now - _TIME_BASE[0] >= _TIME_BASE_REFRESH_SECS:
+        _TIME_BASE = (now, datetime.datetime.utcnow())
+        return _TIME_BASE[1]
+
+    return _TIME_BASE[1] + datetime.timedelta(seconds=now - _TIME_BASE[0])
+
+
+# Placeholder default for arguments whose default depends on other arguments
+_DEFAULT = object()
+
+# The attributes of PipelineStatus that hold its publishing state
+_PUBLISH_ATTRS = {
+    "_publish_callback",
+    "_publish_delay",
+    "_publish_incremental",
+    "_publish_lock",
+    "_publish_timer",
+}
+
+
+def _to_isotime(dt):
+    return dt.isoformat() if dt is not None else None
+
+
+def _write_json(status, path, pretty_print, **kwargs):
+    # `orjson` only supports 2-space indentation, so pretty-printed output is
+    # still generated by `json` to preserve the format of existing files
+    if orjson is None or pretty_print:
+        Serializable.write_json(
+            status, path, pretty_print=pretty_print, **kwargs
+        )
+        return
+
+    s = orjson.dumps(
+        status.serialize(**kwargs),
+        default=ETAJSONEncoder().default,
+        option=orjson.OPT_SERIALIZE_NUMPY,
+    )
+    etau.ensure_basedir(path)
+    with open(path, "wb") as f:
+        f.write(s)
+
+
 class PipelineState(object):
     """Enum describing the possible states of a pipeline."""
 
@@ -44,6 +111,25 @@ class PipelineStatus(Serializable):
     All naive (no timezone) datetimes are assumed to be UTC.
     """
 
+    __slots__ = (
+        "name",
+        "state",
+        "start_time",
+        "complete_time",
+        "fail_time",
+        "messages",
+        "jobs",
+        "_num_messages",
+        "_publish_callback",
+        "_publish_delay",
+        "_publish_incremental",
+        "_publish_lock",
+        "_publish_timer",
+        "_last_msg_idx",
+        "_last_job_msg_inds",
+        "_active_job",
+    )
+
     def __init__(
         self,
         name=None,
@@ -53,6 +139,7 @@ class PipelineStatus(Serializable):
         fail_time=None,
         messages=None,
         jobs=None,
+        max_messages=_DEFAULT,
     ):
         """Creates a PipelineStatus instance.
 
@@ -66,34 +153,190 @@ class PipelineStatus(Serializable):
             fail_time: the fail time the pipeline, or None if not failed
             messages: an optional list of StatusMessage instances
             jobs: an optional list of JobStatus instances
+            max_messages: the maximum number of messages to retain. When this
+                limit is reached, the oldest messages are discarded. If None,
+                all messages are retained. By default, `DEFAULT_MAX_MESSAGES`
+                is used when no `messages` are provided, and all messages are
+                retained otherwise
         """
         self.name = name or ""
         self.state = state
         self.start_time = start_time
         self.complete_time = complete_time
         self.fail_time = fail_time
-        self.messages = messages or []
+
+        if max_messages is _DEFAULT:
+            max_messages = DEFAULT_MAX_MESSAGES if messages is None else None
+
+        self.messages = deque(messages or [], maxlen=max_messages)
         self.jobs = jobs or []
 
-        self._publish_callback = None
+        # The total number of messages ever added, including discarded ones
+        self._num_messages = len(self.messages)
+
+        self._last_msg_idx = 0
+        self._last_job_msg_inds = []
         self._active_job = None
+        self._init_publishing()
+
+    def __getstate__(self):
+        # The publishing state (callback, lock, and timer) is not copied or
+        # pickled
+        return {
+            a: getattr(self, a)
+            for a in self.__slots__
+            if a not in _PUBLISH_ATTRS
+        }
+
+    def __setstate__(self, state):
+        for a, v in state.items():
+            setattr(self, a, v)
+
+        self._init_publishing()
 
-    def set_publish_callback(self, publish_callback):
+    def _init_publishing(self):
+        self._publish_callback = None
+        self._publish_delay = None
+        self._publish_incremental = False
+        self._publish_lock = threading.RLock()
+        self._publish_timer = None
+
+    def set_publish_callback(
+        self, publish_callback, debounce_ms=50, incremental=False
+    ):
         """Sets the callback to use when `publish()` is called.
 
         Args:
             publish_callback: a function that accepts a PipelineStatus object
-                and performs some desired action with it
+                (or a delta dictionary, if `incremental` is True) and performs
+                some desired action with it
+            debounce_ms (50): the number of milliseconds to wait after a
+                `publish()` call before invoking the callback. Any other
+                `publish()` calls made during this time are coalesced into a
+                single callback. Debounced callbacks are invoked on a
+                background thread, so any exceptions they raise are logged
+                rather than raised to the caller of `publish()`. If None or 0,
+                the callback is invoked immediately, on the calling thread
+            incremental (False): whether to pass the callback the output of
+                `get_delta()` rather than the full PipelineStatus
         """
-        self._publish_callback = publish_callback
+        with self._publish_lock:
+            if self._publish_timer is not None:
+                self._publish_timer.cancel()
+                self._publish_timer = None
+
+            self._publish_callback = publish_callback
+            self._publish_delay = (debounce_ms or 0) / 1000.0
+            self._publish_incremental = incremental
 
-    def publish(self):
+    def publish(self, force=False):
         """Publishes the pipeline status using the callback provided via the
         `set_publish_callback()` method (if any).
+
+        Args:
+            force (False): whether to invoke the callback immediately, rather
+                than after the debounce period specified when the callback was
+                set. Use this for terminal state transitions
         """
-        if self._publish_callback:
+        if not self._publish_callback:
+            return
+
+        with self._publish_lock:
+            if force or not self._publish_delay:
+                if self._publish_timer is not None:
+                    self._publish_timer.cancel()
+                    self._publish_timer = None
+
+                self._invoke_publish_callback()
+            elif self._publish_timer is None:
+                self._publish_timer = threading.Timer(
+                    self._publish_delay, self._flush
+                )
+                self._publish_timer.start()
+
+    def _flush(self):
+        with self._publish_lock:
+            # The pending publish may have been superseded by a forced one
+            if self._publish_timer is None:
+                return
+
+            self._publish_timer = None
+            try:
+                self._invoke_publish_callback()
+            except Exception:
+                logger.warning("Failed to publish status", exc_info=True)
+
+    def _invoke_publish_callback(self):
+        if self._publish_incremental:
+            self._publish_callback(self.get_delta())
+        else:
             self._publish_callback(self)
 
+    def publish_full(self):
+        """Immediately publishes the pipeline status in its entirety.
+
+        For incremental callbacks, the delta passed to the callback contains
+        all messages, so this can be used to bootstrap new consumers.
+        """
+        with self._publish_lock:
+            self._last_msg_idx = 0
+            self._last_job_msg_inds = []
+            self.publish(force=True)
+
+    def get_delta(self):
+        """Returns a dictionary describing the changes to the pipeline status
+        since the last call to this method.
+
+        The delta contains the current name, state, and times of the pipeline,
+        the messages added since the last delta, and the same information for
+        each job that has received new messages.
+
+        Returns:
+            a JSON dictionary
+        """
+        with self._publish_lock:
+            # Messages may have been discarded since the last delta
+            num_messages = len(self.messages)
+            num_new = min(
+                self._num_messages - self._last_msg_idx, num_messages
+            )
+            new_messages = list(
+                itertools.islice(self.messages, num_messages - num_new, None)
+            )
+            self._last_msg_idx = self._num_messages
+
+            d = self._get_delta_dict(self, new_messages)
+
+            jobs = list(self.jobs)
+            inds = self._last_job_msg_inds
+            inds.extend([0] * (len(jobs) - len(inds)))
+
+            jobs_delta = []
+            for idx, job in enumerate(jobs):
+                # Jobs may receive new messages while the delta is built
+                num_job_messages = len(job.messages)
+                if num_job_messages > inds[idx]:
+                    new_messages = job.messages[inds[idx] : num_job_messages]
+                    jobs_delta.append(self._get_delta_dict(job, new_messages))
+                    inds[idx] = num_job_messages
+
+            d["jobs_delta"] = jobs_delta
+
+        return d
+
+    @staticmethod
+    def _get_delta_dict(status, new_messages):
+        return OrderedDict(
+            [
+                ("name", status.name),
+                ("state", status.state),
+                ("start_time", _to_isotime(status.start_time)),
+                ("complete_time", _to_isotime(status.complete_time)),
+                ("fail_time", _to_isotime(status.fail_time)),
+                ("new_messages", [m.serialize() for m in new_messages]),
+            ]
+        )
+
     @property
     def active_job(self):
         """The JobStatus instance for the active job, or None if no job is
@@ -118,7 +361,12 @@ class PipelineStatus(Serializable):
             message: the message string
         """
         status_message = StatusMessage(message)
-        self.messages.append(status_message)
+
+        # Deltas and debounced publishes may be read from another thread
+        with self._publish_lock:
+            self.messages.append(status_message)
+            self._num_messages += 1
+
         return status_message.time
 
     def start(self, message="Pipeline started"):
@@ -163,6 +411,20 @@ class PipelineStatus(Serializable):
         self.fail_time = self.add_message(message)
         self.state = PipelineState.FAILED
 
+    def write_json(self, path, pretty_print=False, **kwargs):
+        """Serializes the pipeline status and writes it to disk.
+
+        If `orjson` is installed, it is used to encode non-pretty-printed
+        output.
+
+        Args:
+            path: the output path
+            pretty_print: whether to render the JSON in human readable format
+                with newlines and indentations. By default, this is False
+            **kwargs: optional keyword arguments for `self.serialize()`
+        """
+        _write_json(self, path, pretty_print, **kwargs)
+
     def attributes(self):
         """Returns a list of class attributes to be serialized.
 
@@ -191,9 +453,9 @@ class PipelineStatus(Serializable):
         """
         name = d.get("name", None)
         state = d.get("state", None)
-        start_time = etau.parse_isotime(d.get("start_time"))
-        complete_time = etau.parse_isotime(d.get("complete_time"))
-        fail_time = etau.parse_isotime(d.get("fail_time"))
+        start_time = etau.fast_parse_isotime(d.get("start_time"))
+        complete_time = etau.fast_parse_isotime(d.get("complete_time"))
+        fail_time = etau.fast_parse_isotime(d.get("fail_time"))
 
         messages = d.get("messages", None)
         if messages:
@@ -211,6 +473,8 @@ class PipelineStatus(Serializable):
             fail_time=fail_time,
             messages=messages,
             jobs=jobs,
+            # Loaded statuses retain their full message history
+            max_messages=None,
         )
 
 
@@ -232,6 +496,15 @@ class JobStatus(Serializable):
     All naive (no timezone) datetimes are assumed to be UTC.
     """
 
+    __slots__ = (
+        "name",
+        "state",
+        "start_time",
+        "complete_time",
+        "fail_time",
+        "messages",
+    )
+
     def __init__(
         self,
         name=None,
@@ -307,6 +580,20 @@ class JobStatus(Serializable):
         self.fail_time = self.add_message(message)
         self.state = JobState.FAILED
 
+    def write_json(self, path, pretty_print=False, **kwargs):
+        """Serializes the job status and writes it to disk.
+
+        If `orjson` is installed, it is used to encode non-pretty-printed
+        output.
+
+        Args:
+            path: the output path
+            pretty_print: whether to render the JSON in human readable format
+                with newlines and indentations. By default, this is False
+            **kwargs: optional keyword arguments for `self.serialize()`
+        """
+        _write_json(self, path, pretty_print, **kwargs)
+
     def attributes(self):
         """Returns the list of attributes to serialize.
 
@@ -333,9 +620,9 @@ class JobStatus(Serializable):
             a JobStatus instance
         """
         name = d.get("name", None)
-        start_time = etau.parse_isotime(d.get("start_time"))
-        complete_time = etau.parse_isotime(d.get("complete_time"))
-        fail_time = etau.parse_isotime(d.get("fail_time"))
+        start_time = etau.fast_parse_isotime(d.get("start_time"))
+        complete_time = etau.fast_parse_isotime(d.get("complete_time"))
+        fail_time = etau.fast_parse_isotime(d.get("fail_time"))
 
         messages = d.get("messages", None)
         if messages is not None:
@@ -356,6 +643,8 @@ class StatusMessage(Serializable):
     All naive (no timezone) datetimes are assumed to be UTC.
     """
 
+    __slots__ = ("message", "_time", "_iso")
+
     def __init__(self, message, time=None):
         """Creates a StatusMessage instance.
 
@@ -365,7 +654,17 @@ class StatusMessage(Serializable):
                 time is used
         """
         self.message = message
-        self.time = time or datetime.datetime.utcnow()
+        self.time = time or _utcnow()
+
+    @property
+    def time(self):
+        """The datetime of the message."""
+        return self._time
+
+    @time.setter
+    def time(self, value):
+        self._time = value
+        self._iso = value.isoformat() if value is not None else None
 
     def attributes(self):
         """Returns the list of attributes to serialize.
@@ -375,6 +674,24 @@ class StatusMessage(Serializable):
         """
         return ["message", "time"]
 
+    def serialize(self, reflective=False):
+        """Serializes the message into a dictionary.
+
+        The ISO string of the message's time is computed once when the time
+        is set, so it is not re-formatted each time the status is written.
+
+        Args:
+            reflective: whether to include reflective attributes when
+                serializing the object. By default, this is False
+
+        Returns:
+            a JSON dictionary representation of the message
+        """
+        d = self._prepare_serial_dict(reflective)
+        d["message"] = self.message
+        d["time"] = self._iso
+        return d
+
     @classmethod
     def from_dict(cls, d):
         """Constructs a StatusMessage instance from a JSON dictionary.
@@ -385,5 +702,5 @@ class StatusMessage(Serializable):
         Returns:
             a StatusMessage instance
         """
-        time = etau.parse_isotime(d.get("time"))
+        time = etau.fast_parse_isotime(d.get("time"))
         return StatusMessage(d["message"], time=time)
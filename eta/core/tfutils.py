@@ -20,6 +20,7 @@ from future.utils import iteritems
 
 from copy import copy
 import logging
+import mmap
 import os
 import re
 
@@ -68,32 +69,152 @@ def is_gpu_available():
     return tf.test.is_gpu_available()
 
 
-def load_graph(model_path, sess=None, prefix=""):
+def load_graph(model_path, sess=None, prefix="", graph=None, input_map=None):
     """Loads the TF graph from the given `.pb` file.
 
     Args:
         model_path: the `.pb` file to load
         sess: an optional `tf.Session` into which to load the graph
         prefix: an optional prefix to prepend when importing the graph
+        graph: an optional `tf.Graph` into which to load the graph. Only used
+            when no `sess` is provided
+        input_map: an optional dictionary mapping input tensor names in the
+            `.pb` file to existing `tf.Tensor`s in the graph that should be
+            used in their place
 
     Returns:
         the loaded `tf.Graph`
     """
+    graph_def = load_graph_def(model_path)
+    return import_graph_def(
+        graph_def, sess=sess, prefix=prefix, graph=graph, input_map=input_map
+    )
+
+
+def load_graph_def(model_path):
+    """Loads the `tf.GraphDef` from the given `.pb` file.
+
+    Args:
+        model_path: the `.pb` file to load
+
+    Returns:
+        the `tf.GraphDef`
+    """
+    graph_def = tf.GraphDef()
+    if os.path.isfile(model_path):
+        # Parse local files directly from a memory map so that the serialized
+        # graph is never copied into a Python bytes object
+        with open(model_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                try:
+                    graph_def.ParseFromString(buf)
+                except TypeError:
+                    # This protobuf implementation requires bytes
+                    graph_def.ParseFromString(buf[:])
+    else:
+        with tf.gfile.GFile(model_path, "rb") as f:
+            graph_def.ParseFromString(f.read())
+
+    _fix_batch_norm_nodes(graph_def)
+    return graph_def
+
+
+def import_graph_def(
+    graph_def, sess=None, prefix="", graph=None, input_map=None
+):
+    """Imports the given `tf.GraphDef` into a TF graph.
+
+    Args:
+        graph_def: a `tf.GraphDef`
+        sess: an optional `tf.Session` into which to import the graph
+        prefix: an optional prefix to prepend when importing the graph
+        graph: an optional `tf.Graph` into which to import the graph. Only
+            used when no `sess` is provided
+        input_map: an optional dictionary mapping input tensor names in
+            `graph_def` to existing `tf.Tensor`s in the graph that should be
+            used in their place
+
+    Returns:
+        the `tf.Graph`
+    """
     if sess is not None:
         graph = sess.graph
-    else:
+    elif graph is None:
         graph = tf.Graph()
 
     with graph.as_default():
-        graph_def = tf.GraphDef()
-        with tf.gfile.GFile(model_path, "rb") as f:
-            graph_def.ParseFromString(f.read())
-            _fix_batch_norm_nodes(graph_def)
-            tf.import_graph_def(graph_def, name=prefix)
+        tf.import_graph_def(graph_def, name=prefix, input_map=input_map)
 
     return graph
 
 
+def optimize_graph_def_with_tensorrt(
+    graph_def,
+    output_names,
+    precision_mode="FP16",
+    max_workspace_size_bytes=1 << 32,
+    calibration_feed_fcn=None,
+    num_calibration_runs=None,
+):
+    """Optimizes the given frozen `tf.GraphDef` for GPU inference via TF-TRT.
+
+    Compatible subgraphs are replaced by TensorRT engines that are built for
+    the given precision the first time that they are run.
+
+    INT8 precision requires calibration data, which is used to determine the
+    quantization ranges of the activations. In this case, you must provide
+    `calibration_feed_fcn` and `num_calibration_runs`.
+
+    Args:
+        graph_def: a frozen `tf.GraphDef`
+        output_names: a list of names of nodes that must be preserved in the
+            optimized graph, e.g., the outputs that you will fetch
+        precision_mode: the TensorRT precision mode to use. Supported values
+            are "FP32", "FP16", and "INT8". The default is "FP16"
+        max_workspace_size_bytes: the maximum GPU memory that TensorRT may use
+            as temporary workspace when building engines
+        calibration_feed_fcn: a function that returns a feed dict mapping
+            input tensor names in `graph_def` to a batch of representative
+            inputs each time it is called. Only used for INT8 precision
+        num_calibration_runs: the number of times to call
+            `calibration_feed_fcn` during calibration. Only used for INT8
+            precision
+
+    Returns:
+        the optimized `tf.GraphDef`
+    """
+    # pylint: disable=no-name-in-module
+    from tensorflow.python.compiler.tensorrt import trt_convert as trt
+
+    use_calibration = precision_mode == "INT8"
+    if use_calibration and (
+        calibration_feed_fcn is None or not num_calibration_runs
+    ):
+        raise ValueError(
+            "`calibration_feed_fcn` and `num_calibration_runs` must be "
+            "provided when using INT8 precision"
+        )
+
+    converter = trt.TrtGraphConverter(
+        input_graph_def=graph_def,
+        nodes_blacklist=output_names,
+        precision_mode=precision_mode,
+        max_workspace_size_bytes=max_workspace_size_bytes,
+        is_dynamic_op=True,
+        use_calibration=use_calibration,
+    )
+    graph_def = converter.convert()
+
+    if use_calibration:
+        graph_def = converter.calibrate(
+            fetch_names=[name + ":0" for name in output_names],
+            num_runs=num_calibration_runs,
+            feed_dict_fn=calibration_feed_fcn,
+        )
+
+    return graph_def
+
+
 def _fix_batch_norm_nodes(graph_def):
     # Fix batch norm nodes
     # https://github.com/tensorflow/tensorflow/issues/3628#issuecomment-272149052
@@ -515,3 +636,107 @@ def vgg_preprocessing_numpy(img, height, width):
     img = etai.central_crop(img, shape=(height, width))
     img = np.asarray(img, dtype=np.float32) - IMG_MEAN_IMAGENET
     return img
+
+
+def inception_resize_numpy(img, height, width, out=None):
+    """Performs the resizing step of inception-style preprocessing of an image.
+
+    The image is returned in uint8 format. Use
+    :func:`inception_normalization_tf` to apply the remainder of the
+    preprocessing in-graph.
+
+    Args:
+        img: an integer image. Images that are not uint8 are rescaled to
+            uint8 via :func:`eta.core.image.to_uint8`
+        height: desired image height after preprocessing
+        width: desired image width after preprocessing
+        out: an optional `height x width x 3` uint8 array in which to write
+            the resized image
+
+    Returns:
+        the resized image, in uint8 format
+    """
+    img = etai.to_uint8(img)
+    if etai.is_gray(img):
+        img = etai.gray_to_rgb(img)
+    elif etai.has_alpha(img):
+        img = img[:, :, :3]
+
+    # Images that are already the desired size need not be resized
+    if img.shape[:2] != (height, width):
+        img = etai.resize(img, width=width, height=height)
+
+    return _write_to(img, out)
+
+
+def inception_normalization_tf(imgs):
+    """Applies the normalization step of inception-style preprocessing to the
+    given tensor of uint8 images.
+
+    The images are scaled to [-1, 1] in float32 format.
+
+    Args:
+        imgs: a uint8 `tf.Tensor` of images
+
+    Returns:
+        a float32 `tf.Tensor` of preprocessed images
+    """
+    imgs = tf.cast(imgs, tf.float32) / 255.0
+    return 2.0 * (imgs - 0.5)
+
+
+def vgg_resize_numpy(img, height, width, out=None):
+    """Performs the resizing step of VGG-style preprocessing of an image.
+
+    The image is resized (aspect-preserving) to the desired size and returned
+    in uint8 format. Use :func:`vgg_normalization_tf` to apply the remainder of
+    the preprocessing in-graph.
+
+    Args:
+        img: an integer image. Images that are not uint8 are rescaled to
+            uint8 via :func:`eta.core.image.to_uint8`
+        height: desired height after preprocessing
+        width: desired width after preprocessing
+        out: an optional `height x width x 3` uint8 array in which to write
+            the resized image
+
+    Returns:
+        the resized image, in uint8 format
+    """
+    img = etai.to_uint8(img)
+    if etai.is_gray(img):
+        img = etai.gray_to_rgb(img)
+    elif etai.has_alpha(img):
+        img = img[:, :, :3]
+
+    # Aspect preserving resize
+    if img.shape[0] < img.shape[1]:
+        img = etai.resize(img, height=256)
+    else:
+        img = etai.resize(img, width=256)
+
+    img = etai.central_crop(img, shape=(height, width))
+    return _write_to(img, out)
+
+
+def vgg_normalization_tf(imgs):
+    """Applies the normalization step of VGG-style preprocessing to the given
+    tensor of uint8 images.
+
+    The images are centered by `IMG_MEAN_IMAGENET` in float32 format.
+
+    Args:
+        imgs: a uint8 `tf.Tensor` of images
+
+    Returns:
+        a float32 `tf.Tensor` of preprocessed images
+    """
+    return tf.cast(imgs, tf.float32) - IMG_MEAN_IMAGENET
+
+
+def _write_to(img, out):
+    if out is None:
+        return img
+
+    out[...] = img
+    return out
@@ -25,13 +25,13 @@ import logging
 import os
 
 import eta
-import eta.core.features as etaf
-import eta.core.image as etai
-import eta.core.learning as etal
 import eta.core.utils as etau
-import eta.core.video as etav
 
+etaf = etau.lazy_import("eta.core.features")
+etai = etau.lazy_import("eta.core.image")
+etal = etau.lazy_import("eta.core.learning")
 etat = etau.lazy_import("eta.core.tfutils")
+etav = etau.lazy_import("eta.core.video")
 
 
 logger = logging.getLogger(__name__)
@@ -1367,8 +1367,23 @@ class VideoLabels(
         self.frames[frame_number].add_object(obj)
 
     def _add_detected_objects(self, objects, frame_number):
+        if frame_number is None:
+            for obj in objects:
+                self._add_detected_object(obj, frame_number)
+
+            return
+
+        # Don't create an empty frame when there are no objects to add
+        if not objects:
+            return
+
+        # All objects belong to the same frame, so it need only be looked up
+        # once
         for obj in objects:
-            self._add_detected_object(obj, frame_number)
+            obj.frame_number = frame_number
+
+        self._ensure_frame(frame_number)
+        self.frames[frame_number].add_objects(objects)
 
     def _add_detected_event(self, event, frame_number):
         if frame_number is None:
@@ -3529,6 +3544,56 @@ class FFmpegVideoReader(VideoReader):
                 raise StopIteration
         return self._retrieve()
 
+    def read_into(self, img):
+        """Reads the next frame into the given array.
+
+        This method is equivalent to :meth:`read`, except that the frame is
+        decoded directly into ``img`` rather than into a newly allocated
+        array, which avoids a large allocation per frame when the same array
+        is reused to read many frames.
+
+        Args:
+            img: a C-contiguous ``height x width x 3`` uint8 array
+
+        Returns:
+            img
+
+        Raises:
+            StopIteration: if there are no more frames to process or the next
+                frame could not be read for any reason
+        """
+        width, height = self.frame_size
+        if (
+            img.shape != (height, width, 3)
+            or img.dtype != np.uint8
+            or not img.flags.c_contiguous
+        ):
+            raise ValueError(
+                "Expected a C-contiguous %dx%dx3 uint8 array; found %s %s"
+                % (height, width, "x".join(map(str, img.shape)), img.dtype)
+            )
+
+        for _ in range(max(0, self.frame_number), next(self._ranges)):
+            if not self._grab_into(img):
+                logger.warning(
+                    "Failed to grab frame %d. Raising StopIteration now",
+                    self.frame_number,
+                )
+                raise StopIteration
+
+        return img
+
+    def _grab_into(self, img):
+        self._raw_frame = None
+        try:
+            num_bytes = self._ffmpeg.read_into(img)
+        except Exception as e:
+            logger.warning(e, exc_info=True)
+            return False
+
+        # Fewer bytes are read when the end of the video is reached
+        return num_bytes == img.nbytes
+
     def _grab(self):
         try:
             width, height = self.frame_size
@@ -4234,6 +4299,33 @@ class FFmpeg(object):
             raise FFmpegStreamingError("Not currently output streaming")
         return self._p.stdout.read(num_bytes)
 
+    def read_into(self, buffer):
+        """Reads bytes from ffmpeg's stdout stream into the given buffer until
+        it is full or the stream is exhausted.
+
+        Args:
+            buffer: a writable bytes-like object
+
+        Returns:
+            the number of bytes read
+
+        Raises:
+            FFmpegStreamingError: if output streaming mode is not active
+        """
+        if not self.is_output_streaming:
+            raise FFmpegStreamingError("Not currently output streaming")
+
+        view = memoryview(buffer).cast("B")
+        num_bytes = 0
+        while num_bytes < len(view):
+            n = self._p.stdout.readinto(view[num_bytes:])
+            if not n:
+                break
+
+            num_bytes += n
+
+        return num_bytes
+
     def close(self):
         """Closes a streaming ffmpeg program, if necessary."""
         if self.is_input_streaming or self.is_output_streaming:
@@ -23,22 +23,49 @@ from builtins import *
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
 
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import heapq
+import itertools
 import logging
 import os
 import sys
 
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from eta.core.config import Config, ConfigError
-import eta.core.image as etai
-import eta.core.features as etaf
-import eta.core.learning as etal
 import eta.core.module as etam
+import eta.core.serial as etas
 import eta.core.utils as etau
-import eta.core.video as etav
+
+etaf = etau.lazy_import("eta.core.features")
+etai = etau.lazy_import("eta.core.image")
+etal = etau.lazy_import("eta.core.learning")
+etav = etau.lazy_import("eta.core.video")
 
 
 logger = logging.getLogger(__name__)
 
 
+# The number of threads and the number of images to read ahead of the detector
+# when processing directories of images
+_NUM_READ_WORKERS = 4
+_READ_AHEAD = 8
+
+# The number of decoded images to cache per run, for configs that process the
+# same images more than once
+_READ_CACHE_SIZE = 64
+
+# The attributes that `VideoLabels.attributes()` serializes after the frames
+_ATTRS_AFTER_FRAMES = ("objects", "events")
+
+
 class ModuleConfig(etam.BaseModuleConfig):
     """Module configuration settings.
 
@@ -52,6 +79,29 @@ class ModuleConfig(etam.BaseModuleConfig):
         self.data = self.parse_object_array(d, "data", DataConfig)
         self.parameters = self.parse_object(d, "parameters", ParametersConfig)
 
+    @classmethod
+    def from_json(cls, path):
+        """Constructs a ModuleConfig from a JSON file.
+
+        If `orjson` is installed, it is used to parse the file.
+
+        Args:
+            path: the path to the JSON file on disk
+
+        Returns:
+            a ModuleConfig
+        """
+        if orjson is None:
+            return super(ModuleConfig, cls).from_json(path)
+
+        try:
+            with open(path, "rb") as f:
+                d = orjson.loads(f.read())
+        except ValueError:
+            raise ValueError("Unable to parse JSON file '%s'" % path)
+
+        return cls.from_dict(d)
+
 
 class DataConfig(Config):
     """Data configuration settings.
@@ -133,26 +183,20 @@ class DataConfig(Config):
 
         self._validate()
 
-    def _validate(self):
-        if self.video_path:
-            if not self.output_labels_path:
-                raise ConfigError(
-                    "`output_labels_path` is required when `video_path` is "
-                    "set"
-                )
-
-        if self.image_path:
-            if not self.output_image_labels_path:
-                raise ConfigError(
-                    "`output_image_labels_path` is required when `image_path` "
-                    "is set"
-                )
+    # `(input, output)` pairs of fields for which the output is required when
+    # the input is set
+    _REQUIRED = [
+        ("video_path", "output_labels_path"),
+        ("image_path", "output_image_labels_path"),
+        ("images_dir", "output_image_set_labels_path"),
+    ]
 
-        if self.images_dir:
-            if not self.output_image_set_labels_path:
+    def _validate(self):
+        for input_field, output_field in self._REQUIRED:
+            if getattr(self, input_field) and not getattr(self, output_field):
                 raise ConfigError(
-                    "`output_image_set_labels_path` is required when "
-                    "`images_dir` is set"
+                    "`%s` is required when `%s` is set"
+                    % (output_field, input_field)
                 )
 
 
@@ -169,6 +213,8 @@ class ParametersConfig(Config):
             used
         record_top_k_probs (eta.core.types.Number): [None] the number of top-k
             class probabilities to record for the predictions
+        batch_size (eta.core.types.Number): [16] the number of video frames to
+            process per batch, if the detector supports batched inference
     """
 
     def __init__(self, d):
@@ -181,62 +227,117 @@ class ParametersConfig(Config):
         self.record_top_k_probs = self.parse_number(
             d, "record_top_k_probs", default=None
         )
+        self.batch_size = self.parse_number(d, "batch_size", default=16)
 
 
 class ObjectsConfig(Config):
-    """Objects configuration settings."""
+    """Objects configuration settings.
+
+    Attributes:
+        labels: an optional iterable of object labels to detect. The labels
+            are matched as a set, so their order and any duplicates are
+            irrelevant. If omitted, all labels are detected
+        threshold: an optional confidence threshold for the detections
+    """
 
     def __init__(self, d):
         self.labels = self.parse_array(d, "labels", default=None)
         self.threshold = self.parse_number(d, "threshold", default=None)
 
 
-def _build_object_filter(labels, threshold):
+def _parse_object_filter(labels, threshold):
+    if labels is not None:
+        labels = frozenset(labels)
+
     if threshold is not None:
         threshold = float(threshold)
 
     if labels is None:
         if threshold is None:
             logger.info("Detecting all objects")
-            filter_fcn = lambda obj: True
         else:
             logger.info(
                 "Detecting all objects with confidence >= %g", threshold
             )
-            filter_fcn = lambda obj: obj.confidence >= threshold
     else:
         if threshold is None:
-            logger.info("Detecting %s", labels)
-            filter_fcn = lambda obj: obj.label in labels
+            logger.info("Detecting %s", sorted(labels))
         else:
             logger.info(
-                "Detecting %s with confidence >= %g", labels, threshold
-            )
-            filter_fcn = (
-                lambda obj: obj.label in labels and obj.confidence >= threshold
+                "Detecting %s with confidence >= %g", sorted(labels), threshold
             )
 
-    return filter_fcn
+    return labels, threshold
 
 
 def _build_detection_filter(objects_config):
     if objects_config is None:
-        # Return all detections
-        return lambda objects: (objects, list(range(len(objects))))
+        return _keep_all_objects
 
-    # Parse object filter
+    # Parse object filters
     obj_filters = [
-        _build_object_filter(oc.labels, oc.threshold) for oc in objects_config
+        _parse_object_filter(oc.labels, oc.threshold) for oc in objects_config
     ]
 
+    mask_fcn = _compile_mask_fcn(obj_filters)
+    if mask_fcn is None:
+        return _keep_all_objects
+
     def object_filter(objects):
-        inds = objects.get_matching_inds(obj_filters)
+        inds = _get_matching_inds(objects, mask_fcn)
         objects.keep_inds(inds)
         return objects, inds
 
     return object_filter
 
 
+def _keep_all_objects(objects):
+    # Return all detections
+    return objects, list(range(len(objects)))
+
+
+def _compile_mask_fcn(obj_filters):
+    # Generates a single function that evaluates all filters at once, with
+    # their labels and thresholds bound as constants, so no per-filter
+    # dispatch is required. Returns None if all objects match
+    namespace = {"np": np}
+    terms = []
+    for idx, (obj_labels, threshold) in enumerate(obj_filters):
+        conditions = []
+        if obj_labels is not None:
+            namespace["L%d" % idx] = list(obj_labels)
+            conditions.append("np.isin(labels, L%d)" % idx)
+
+        if threshold is not None:
+            namespace["T%d" % idx] = threshold
+            conditions.append("(confidences >= T%d)" % idx)
+
+        if not conditions:
+            return None
+
+        terms.append("(%s)" % " & ".join(conditions))
+
+    src = "def mask_fcn(labels, confidences):\n    return %s\n" % (
+        " | ".join(terms)
+    )
+    exec(src, namespace)  # pylint: disable=exec-used
+    return namespace["mask_fcn"]
+
+
+def _get_matching_inds(objects, mask_fcn):
+    if not objects:
+        return []
+
+    # Evaluate the filters on all objects at once, rather than calling a
+    # Python function per object per filter
+    labels = np.array([obj.label for obj in objects], dtype=object)
+    confidences = np.array(
+        [obj.confidence for obj in objects], dtype=np.float64
+    )
+
+    return np.flatnonzero(mask_fcn(labels, confidences)).tolist()
+
+
 def _apply_object_detector(config):
     # Build detector
     detector = config.parameters.detector.build()
@@ -246,37 +347,82 @@ def _apply_object_detector(config):
     if record_top_k_probs:
         etal.ExposesProbabilities.ensure_exposes_probabilities(detector)
 
+    # Check feature support once, before any data is processed
+    if any(_writes_features(data) for data in config.data):
+        etal.ExposesFeatures.ensure_exposes_features(detector)
+
     # Build object filter
     object_filter = _build_detection_filter(config.parameters.objects)
 
+    # Batched inference is only used when the detector natively supports it
+    if _supports_batching(detector):
+        batch_size = max(int(config.parameters.batch_size), 1)
+    else:
+        batch_size = 1
+
+    # Images are cached only for the duration of this run
+    read_image = _make_image_reader()
+
     # Process data
     with detector:
         for data in config.data:
             if data.video_path:
                 logger.info("Processing video '%s'", data.video_path)
                 _process_video(
-                    data, detector, object_filter, record_top_k_probs
+                    data,
+                    detector,
+                    object_filter,
+                    record_top_k_probs,
+                    batch_size,
                 )
             if data.image_path:
                 logger.info("Processing image '%s'", data.image_path)
                 _process_image(
-                    data, detector, object_filter, record_top_k_probs
+                    data,
+                    detector,
+                    object_filter,
+                    record_top_k_probs,
+                    read_image,
                 )
             if data.images_dir:
                 logger.info("Processing image directory '%s'", data.images_dir)
                 _process_images_dir(
-                    data, detector, object_filter, record_top_k_probs
+                    data,
+                    detector,
+                    object_filter,
+                    record_top_k_probs,
+                    read_image,
                 )
 
 
-def _process_video(data, detector, object_filter, record_top_k_probs):
+def _writes_features(data):
+    return any(
+        features_dir is not None
+        for features_dir in (
+            data.video_features_dir,
+            data.image_features_dir,
+            data.image_set_features_dir,
+        )
+    )
+
+
+def _supports_batching(detector):
+    # The default `detect_all()` simply calls `detect()` on each image, in
+    # which case the features/probabilities of all but the last image are lost
+    return type(detector).detect_all is not etal.ObjectDetector.detect_all
+
+
+def _process_video(
+    data, detector, object_filter, record_top_k_probs, batch_size
+):
     write_features = data.video_features_dir is not None
 
     if write_features:
-        etal.ExposesFeatures.ensure_exposes_features(detector)
         features_handler = etaf.VideoObjectsFeaturesHandler(
             data.video_features_dir
         )
+    else:
+        features_handler = None
 
     if data.input_labels_path:
         logger.info(
@@ -286,36 +432,170 @@ def _process_video(data, detector, object_filter, record_top_k_probs):
     else:
         video_labels = etav.VideoLabels()
 
-    # Detect objects in frames of video
-    with etav.FFmpegVideoReader(data.video_path) as vr:
-        for img in vr:
-            logger.debug("Processing frame %d", vr.frame_number)
+    # Detect objects in batches of frames of video
+    debug = logger.isEnabledFor(logging.DEBUG)
+    with _VideoLabelsWriter(
+        data.output_labels_path, video_labels
+    ) as labels_writer, etav.FFmpegVideoReader(data.video_path) as vr:
+        # Frames are decoded directly into a batch array that is reused for
+        # all batches of the video
+        width, height = vr.frame_size
+        imgs = np.empty((batch_size, height, width, 3), dtype=np.uint8)
+        frame_numbers = []
+        while True:
+            try:
+                vr.read_into(imgs[len(frame_numbers)])
+            except StopIteration:
+                break
+
+            frame_number = vr.frame_number
+            if debug:
+                logger.debug("Processing frame %d", frame_number)
+
+            frame_numbers.append(frame_number)
+            if len(frame_numbers) >= batch_size:
+                _process_frames(
+                    frame_numbers,
+                    imgs,
+                    detector,
+                    object_filter,
+                    record_top_k_probs,
+                    labels_writer,
+                    features_handler,
+                )
+                frame_numbers = []
+
+        # Process any remaining frames
+        if frame_numbers:
+            _process_frames(
+                frame_numbers,
+                imgs[: len(frame_numbers)],
+                detector,
+                object_filter,
+                record_top_k_probs,
+                labels_writer,
+                features_handler,
+            )
+
+        logger.info("Writing labels to '%s'", data.output_labels_path)
+
+
+class _VideoLabelsWriter(object):
+    """Context manager that writes VideoLabels to disk one frame at a time.
+
+    Frames are appended to an NDJSON file as they are added, and the final
+    VideoLabels JSON is assembled from this file when the context exits, so
+    the frames of the video are never all held in memory at once.
+    """
 
-            # Detect objects
-            objects, inds = _detect_objects(
-                img, detector, object_filter, record_top_k_probs
+    def __init__(self, path, video_labels):
+        """Creates a _VideoLabelsWriter instance.
+
+        Args:
+            path: the output path for the VideoLabels
+            video_labels: a VideoLabels to which to add the frames. Its frames
+                are consumed as they are written
+        """
+        self.path = path
+        self._video_labels = video_labels
+        self._frames_path = path + ".ndjson"
+        self._frame_numbers = []
+        self._frames_file = None
+
+    def __enter__(self):
+        etau.ensure_basedir(self._frames_path)
+        self._frames_file = open(self._frames_path, "wt")
+        return self
+
+    def __exit__(self, exc_type, *args):
+        try:
+            self._frames_file.close()
+            if exc_type is None:
+                self._write_json()
+        finally:
+            etau.delete_file(self._frames_path)
+
+    def add_objects(self, objects, frame_number):
+        """Adds the objects for the given frame.
+
+        Each frame must be added at most once, in increasing order.
+
+        Args:
+            objects: a DetectedObjectContainer
+            frame_number: the frame number
+        """
+        if self._video_labels.has_frame(frame_number):
+            frame_labels = self._video_labels.get_frame(frame_number)
+            self._video_labels.delete_frame(frame_number)
+        elif objects:
+            frame_labels = etav.VideoFrameLabels(frame_number=frame_number)
+        else:
+            return
+
+        for obj in objects:
+            obj.frame_number = frame_number
+
+        frame_labels.add_objects(objects)
+
+        self._frames_file.write(_to_json_str(frame_labels) + "\n")
+        self._frame_numbers.append(frame_number)
+
+    def _write_json(self):
+        # Merge the streamed frames with any remaining frames of the labels
+        remaining_frames = [
+            (frame_number, _to_json_str(frame_labels))
+            for frame_number, frame_labels in self._video_labels.frames.items()
+        ]
+        self._video_labels.frames.clear()
+
+        # Split the other attributes around the frames to preserve the order
+        # of `VideoLabels.attributes()`
+        d = self._video_labels.serialize()
+        tail = OrderedDict(
+            (a, d.pop(a)) for a in _ATTRS_AFTER_FRAMES if a in d
+        )
+        header = _to_json_str(d)
+        footer = _to_json_str(tail)
+
+        with open(self._frames_path, "rt") as f:
+            streamed_frames = zip(
+                self._frame_numbers, (line.rstrip("\n") for line in f)
+            )
+            frames = heapq.merge(
+                remaining_frames, streamed_frames, key=lambda f: f[0]
             )
 
-            # Write features, if necessary
-            if write_features:
-                features = detector.get_features()
-                features = features[inds, :]
-                features_handler.write_features(features, vr.frame_number)
+            # Emulates the output of `VideoLabels.write_json()`
+            with open(self.path, "wt") as out:
+                out.write(header[:-1])
+
+                sep = '"frames": {' if header == "{}" else ',"frames": {'
+                for frame_number, frame_str in frames:
+                    out.write('%s"%d": %s' % (sep, frame_number, frame_str))
+                    sep = ","
+
+                if sep == ",":
+                    out.write("}")
+
+                if footer != "{}":
+                    if header != "{}" or sep == ",":
+                        out.write(",")
+
+                    out.write(footer[1:-1])
+
+                out.write("}")
 
-            # Record objects
-            for obj in objects:
-                obj.frame_number = vr.frame_number
-                video_labels.add_object(obj, vr.frame_number)
 
-    logger.info("Writing labels to '%s'", data.output_labels_path)
-    video_labels.write_json(data.output_labels_path)
+def _to_json_str(obj):
+    return etas.json_to_str(obj, pretty_print=False)
 
 
-def _process_image(data, detector, object_filter, record_top_k_probs):
+def _process_image(
+    data, detector, object_filter, record_top_k_probs, read_image
+):
     write_features = data.image_features_dir is not None
 
     if write_features:
-        etal.ExposesFeatures.ensure_exposes_features(detector)
         features_handler = etaf.ImageObjectsFeaturesHandler(
             data.image_features_dir
         )
@@ -329,15 +609,14 @@ def _process_image(data, detector, object_filter, record_top_k_probs):
         image_labels = etai.ImageLabels()
 
     # Detect objects
-    img = etai.read(data.image_path)
+    img = read_image(data.image_path)
     objects, inds = _detect_objects(
         img, detector, object_filter, record_top_k_probs
     )
 
     # Write features, if necessary
     if write_features:
-        features = detector.get_features()
-        features = features[inds, :]
+        features = _get_object_features(detector.get_features(), inds)
         features_handler.write_features(features)
 
     # Record objects
@@ -347,11 +626,12 @@ def _process_image(data, detector, object_filter, record_top_k_probs):
     image_labels.write_json(data.output_image_labels_path)
 
 
-def _process_images_dir(data, detector, object_filter, record_top_k_probs):
+def _process_images_dir(
+    data, detector, object_filter, record_top_k_probs, read_image
+):
     write_features = data.image_set_features_dir is not None
 
     if write_features:
-        etal.ExposesFeatures.ensure_exposes_features(detector)
         features_handler = etaf.ImageSetObjectsFeaturesHandler(
             data.image_set_features_dir
         )
@@ -367,21 +647,26 @@ def _process_images_dir(data, detector, object_filter, record_top_k_probs):
     else:
         image_set_labels = etai.ImageSetLabels()
 
+    entries = _list_image_files(data.images_dir)
+
+    # Repeated passes over directories larger than the cache would never hit
+    # it, so their images are read directly
+    if len(entries) > _READ_CACHE_SIZE:
+        read_image = etai.read
+
     # Detect objects in images in directory
-    for filename in etau.list_files(data.images_dir):
-        inpath = os.path.join(data.images_dir, filename)
-        logger.info("Processing image '%s'", inpath)
+    for entry, img in _read_images(entries, read_image):
+        filename = entry.name
+        logger.info("Processing image '%s'", entry.path)
 
         # Detect objects
-        img = etai.read(inpath)
         objects, inds = _detect_objects(
             img, detector, object_filter, record_top_k_probs
         )
 
         # Write features, if necessary
         if write_features:
-            features = detector.get_features()
-            features = features[inds, :]
+            features = _get_object_features(detector.get_features(), inds)
             features_handler.write_features(features, filename)
 
         # Record objects
@@ -391,6 +676,98 @@ def _process_images_dir(data, detector, object_filter, record_top_k_probs):
     image_set_labels.write_json(data.output_image_set_labels_path)
 
 
+def _process_frames(
+    frame_numbers,
+    imgs,
+    detector,
+    object_filter,
+    record_top_k_probs,
+    labels_writer,
+    features_handler,
+):
+    # Detect objects
+    all_objects = detector.detect_all(imgs)
+
+    # Record top-k classes, if necessary
+    if record_top_k_probs:
+        all_top_k_probs = detector.get_top_k_classes(record_top_k_probs)
+        for objects, top_k_probs in zip(all_objects, all_top_k_probs):
+            for obj, obj_top_k_probs in zip(objects, top_k_probs):
+                obj.top_k_probs = obj_top_k_probs
+
+    if features_handler is not None:
+        all_features = detector.get_features()
+
+    for idx, (frame_number, objects) in enumerate(
+        zip(frame_numbers, all_objects)
+    ):
+        # Filter detections
+        objects, inds = object_filter(objects)
+
+        # Write features, if necessary
+        if features_handler is not None:
+            features = _get_object_features(all_features[idx], inds)
+            features_handler.write_features(features, frame_number)
+
+        # Record objects
+        labels_writer.add_objects(objects, frame_number)
+
+
+def _make_image_reader():
+    @lru_cache(maxsize=_READ_CACHE_SIZE)
+    def _cached_read(path, mtime):  # pylint: disable=unused-argument
+        img = etai.read(path)
+        img.flags.writeable = False
+        return img
+
+    def read_image(path):
+        # Keying on the modification time ensures that edited files are
+        # re-read. Copies are returned so that callers cannot corrupt the
+        # cached images by modifying them in-place
+        return _cached_read(path, os.path.getmtime(path)).copy()
+
+    return read_image
+
+
+def _list_image_files(images_dir):
+    # Equivalent to `etau.list_files()`, but `os.scandir()` provides the paths
+    # of the files and can usually determine their types without a `stat()`
+    with os.scandir(images_dir) as it:
+        entries = [
+            entry
+            for entry in it
+            if entry.is_file() and not entry.name.startswith(".")
+        ]
+
+    return sorted(entries, key=lambda entry: entry.name)
+
+
+def _get_object_features(features, inds):
+    # Selects the features of the objects that were kept by the object filter
+    return features[inds]
+
+
+def _read_images(entries, read_image):
+    # Images are read in background threads, `_READ_AHEAD` images ahead of the
+    # consumer, so that disk I/O and decoding overlap with detection
+    entries = iter(entries)
+    with ThreadPoolExecutor(max_workers=_NUM_READ_WORKERS) as executor:
+
+        def _submit(entry):
+            pending.append((entry, executor.submit(read_image, entry.path)))
+
+        pending = deque()
+        for entry in itertools.islice(entries, _READ_AHEAD):
+            _submit(entry)
+
+        while pending:
+            entry, future = pending.popleft()
+            for next_entry in itertools.islice(entries, 1):
+                _submit(next_entry)
+
+            yield entry, future.result()
+
+
 def _detect_objects(img, detector, object_filter, record_top_k_probs):
     # Perform detection
     objects = detector.detect(img)